@@ -8,4 +8,5 @@ set -o errexit
 
 pipenv install
 
-pipenv run upgrade
\ No newline at end of file
+pipenv run upgrade
+pipenv run purge
\ No newline at end of file
@@ -1,16 +1,178 @@
 import os
 from flask_admin import Admin
-from models import db, User
+from models import db, User, People, Planet, FavoritePeople, FavoritePlanet
+from events import broker
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.ajax import QueryAjaxModelLoader
+from flask_admin.contrib.sqla.filters import BaseSQLAFilter, FilterEqual, IntEqualFilter
+from flask_admin.model.ajax import DEFAULT_PAGE_SIZE
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+def prefix_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+# Admin lookups only use equality and prefix matches, which the B-tree indexes
+# can serve, instead of Flask-Admin's default ILIKE '%term%'
+class FilterStartsWith(BaseSQLAFilter):
+    def apply(self, query, value, alias=None):
+        return query.filter(self.get_column(alias).like(prefix_pattern(value), escape='\\'))
+
+    def operation(self):
+        return 'starts with'
+
+class LiveAjaxModelLoader(QueryAjaxModelLoader):
+    # Picker for relationship fields, it never offers soft deleted rows
+    def __init__(self, name, session, model, **options):
+        self.exact = options.pop('exact', False)
+        super().__init__(name, session, model, **options)
+
+    def get_query(self):
+        if hasattr(self.model, 'query_live'):
+            return self.model.query_live()
+        return super().get_query()
+
+    def get_one(self, pk):
+        if hasattr(self.model, 'get_live'):
+            return self.model.get_live(pk)
+        return super().get_one(pk)
+
+    def get_list(self, term, offset=0, limit=DEFAULT_PAGE_SIZE):
+        if self.exact:
+            filters = [field == term for field in self._cached_fields]
+        else:
+            filters = [field.like(prefix_pattern(term), escape='\\') for field in self._cached_fields]
+        return self.get_query().filter(or_(*filters)).offset(offset).limit(limit).all()
+
+class CatalogModelView(ModelView):
+    page_size = 50
+    can_set_page_size = True
+    page_size_options = (20, 50, 100)
+    # Above this many rows an exact COUNT(*) costs more than the page itself
+    approximate_count_threshold = 100000
+    # Admin changes are published like API ones, so caches and /events see them
+    event_topic = None
+    # Stable page order, views only allow sorting on indexed columns
+    column_default_sort = 'id'
+    column_sortable_list = ('id',)
+
+    def estimate_count(self):
+        if db.engine.dialect.name != 'postgresql':
+            return None
+        return db.session.execute(
+            db.text('SELECT reltuples::bigint FROM pg_class WHERE relname = :table'),
+            {"table": self.model.__tablename__}
+        ).scalar()
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        # Only unfiltered listings can use the planner's row estimate
+        if not search and not filters:
+            estimate = self.estimate_count()
+            if estimate is not None and estimate >= self.approximate_count_threshold:
+                query = self.get_query()
+                for relation in self._auto_joins:
+                    query = query.options(joinedload(relation))
+                query, _ = self._apply_sorting(query, {}, sort_column, sort_desc)
+                query = self._apply_pagination(query, page, page_size)
+                return estimate, query.all() if execute else query
+        return super().get_list(page, sort_column, sort_desc, search, filters, execute, page_size)
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        # Prefix match on the whole term, the searchable columns have pattern ops indexes
+        pattern = prefix_pattern(search.strip())
+        search_filter = or_(*[field.like(pattern, escape='\\') for field, path in self._search_fields])
+        query = query.filter(search_filter)
+        if count_query is not None:
+            count_query = count_query.filter(search_filter)
+        return query, count_query, joins, count_joins
+
+    def event_data(self, model):
+        return model.serialize()
+
+    def after_model_change(self, form, model, is_created):
+        if self.event_topic is not None:
+            broker.publish(self.event_topic, 'created' if is_created else 'updated', self.event_data(model))
+
+    def after_model_delete(self, model):
+        if self.event_topic is not None:
+            broker.publish(self.event_topic, 'deleted', self.event_data(model))
+
+class UserView(CatalogModelView):
+    column_list = ('id', 'email', 'is_active')
+    column_sortable_list = ('id', 'email')
+    column_searchable_list = ('email',)
+    column_filters = (IntEqualFilter(User.id, 'Id'), FilterEqual(User.email, 'Email'))
+    # The favorites backrefs would load every favorite row into the form
+    form_excluded_columns = ('favorite_people', 'favorite_planets')
+
+class CatalogEntityView(CatalogModelView):
+    # Soft deletes go through the API so the favorites purge gets queued,
+    # deleted rows are hidden so they can't be edited or announced again
+    form_excluded_columns = ('deleted_at',)
+    column_exclude_list = ('deleted_at',)
+    column_sortable_list = ('id', 'name')
+    column_searchable_list = ('name',)
+    can_delete = False
+
+    def __init__(self, model, session, **kwargs):
+        self.event_topic = model.__tablename__
+        self.column_filters = (
+            IntEqualFilter(model.id, 'Id'),
+            FilterEqual(model.name, 'Name'),
+            FilterStartsWith(model.name, 'Name'),
+        )
+        super().__init__(model, session, **kwargs)
+
+    def get_query(self):
+        return super().get_query().filter(self.model.deleted_at.is_(None))
+
+    def get_count_query(self):
+        return super().get_count_query().filter(self.model.deleted_at.is_(None))
+
+    def get_one(self, id):
+        return self.model.get_live(id)
+
+class FavoritePeopleView(CatalogModelView):
+    event_topic = 'favorite'
+    column_list = ('id', 'user_id', 'user', 'people_id', 'people')
+    column_sortable_list = ('id', 'user_id', 'people_id')
+    column_select_related_list = (FavoritePeople.user, FavoritePeople.people)
+    column_filters = (IntEqualFilter(FavoritePeople.user_id, 'User Id'), IntEqualFilter(FavoritePeople.people_id, 'People Id'))
+    form_ajax_refs = {
+        'user': LiveAjaxModelLoader('user', db.session, User, fields=['email'], exact=True),
+        'people': LiveAjaxModelLoader('people', db.session, People, fields=['name']),
+    }
+
+    def event_data(self, model):
+        return {"user_id": model.user_id, "people_id": model.people_id}
+
+class FavoritePlanetView(CatalogModelView):
+    event_topic = 'favorite'
+    column_list = ('id', 'user_id', 'user', 'planet_id', 'planet')
+    column_sortable_list = ('id', 'user_id', 'planet_id')
+    column_select_related_list = (FavoritePlanet.user, FavoritePlanet.planet)
+    column_filters = (IntEqualFilter(FavoritePlanet.user_id, 'User Id'), IntEqualFilter(FavoritePlanet.planet_id, 'Planet Id'))
+    form_ajax_refs = {
+        'user': LiveAjaxModelLoader('user', db.session, User, fields=['email'], exact=True),
+        'planet': LiveAjaxModelLoader('planet', db.session, Planet, fields=['name']),
+    }
+
+    def event_data(self, model):
+        return {"user_id": model.user_id, "planet_id": model.planet_id}
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(CatalogEntityView(People, db.session))
+    admin.add_view(CatalogEntityView(Planet, db.session))
+    admin.add_view(FavoritePeopleView(FavoritePeople, db.session))
+    admin.add_view(FavoritePlanetView(FavoritePlanet, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
@@ -1,12 +1,18 @@
 
 import os
-from flask import Flask, request, jsonify, url_for
+import click
+from flask import Flask, Response, request, jsonify, url_for
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
 from utils import APIException, generate_sitemap
 from admin import setup_admin
 from models import db, User, People, Planet, FavoritePlanet, FavoritePeople
+from events import broker, format_sse
+from idempotency import idempotent
+from coalescing import coalesced, single_flight
+from jobs import FavoritePurger, purge_deleted_favorites
+from cache import entity_cache, load_entities
 #from models import Person
 
 app = Flask(__name__)
@@ -23,6 +29,18 @@ MIGRATE = Migrate(app, db)
 db.init_app(app)
 CORS(app)
 setup_admin(app)
+purger = FavoritePurger(app)
+
+CACHED_PATHS = {"people": "/people", "planet": "/planets"}
+MAX_BATCH_IDS = 100
+
+# Drop coalesced GET results as soon as the data behind them changes
+def invalidate_cached_reads(event):
+    if event['topic'] in CACHED_PATHS:
+        single_flight.invalidate(CACHED_PATHS[event['topic']])
+        entity_cache.invalidate(event['topic'], event['data'].get('id'))
+
+broker.add_listener(invalidate_cached_reads)
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
@@ -52,6 +70,7 @@ def get_user(user_id):
     return jsonify(user.serialize()), 200
 
 @app.route('/user', methods=['POST'])
+@idempotent
 def create_user():
     body = request.get_json()  
     if not body:
@@ -106,22 +125,42 @@ def delete_user(user_id):
     return jsonify({"msg": "User deleted successfully"}), 200
 
 
+# Fetches a comma separated list of ids in one go, keeping the requested order
+def get_many(model, raw_ids, not_found_msg):
+    try:
+        ids = [int(entity_id) for entity_id in raw_ids.split(',')]
+    except ValueError:
+        return jsonify({"msg": "ids must be a comma separated list of integers"}), 400
+    if len(ids) > MAX_BATCH_IDS:
+        return jsonify({"msg": f"At most {MAX_BATCH_IDS} ids per request"}), 400
+
+    found = load_entities(model, ids)
+    results = [found.get(entity_id, {"id": entity_id, "msg": not_found_msg}) for entity_id in ids]
+
+    return jsonify(results), 200
+
 @app.route('/people', methods=['GET'])
+@coalesced
 def get_all_people():
-    all_people = People.query.all()  
+    if 'ids' in request.args:
+        return get_many(People, request.args['ids'], 'Person not found')
+
+    all_people = People.query_live().all()  
     all_people_serialize = [person.serialize() for person in all_people]  
     
     return jsonify(all_people_serialize), 200
 
 
 @app.route('/people/<int:person_id>', methods=['GET'])
+@coalesced
 def get_person(person_id):
-    person = People.query.get(person_id)  
+    person = People.get_live(person_id)  
     if person is None:
         return jsonify({'msg': 'Person not found'}), 404  
     return jsonify(person.serialize()), 200  
 
 @app.route('/people', methods=['POST'])
+@idempotent
 def create_people():
     body = request.get_json()
 
@@ -144,13 +183,14 @@ def create_people():
     try:
         db.session.add(new_people)
         db.session.commit()
+        broker.publish('people', 'created', new_people.serialize())
         return jsonify(new_people.serialize()), 201  # Devuelve el objeto creado con código 201
     except Exception as e:
         return jsonify({'msg': 'Error creating People', 'error': str(e)}), 500
     
 @app.route('/people/<int:person_id>', methods=['PUT'])
 def update_person(person_id):
-    person = People.query.get(person_id)
+    person = People.get_live(person_id)
     if person is None:
         return jsonify({'msg': 'Person not found'}), 404
 
@@ -170,37 +210,47 @@ def update_person(person_id):
         person.hair_color = body["hair_color"]
 
     db.session.commit()
+    broker.publish('people', 'updated', person.serialize())
 
     return jsonify(person.serialize()), 200
 
 @app.route('/people/<int:person_id>', methods=['DELETE'])
 def delete_person(person_id):
-    person = People.query.get(person_id)
+    person = People.get_live(person_id)
     if person is None:
         return jsonify({'msg': 'Person not found'}), 404
 
-    db.session.delete(person)
+    # Soft delete keeps this request cheap, favorites are purged in the background
+    person.deleted_at = db.func.now()
     db.session.commit()
+    purger.enqueue(People, person_id)
+    broker.publish('people', 'deleted', {"id": person_id})
 
     return jsonify({"msg": "Person deleted successfully"}), 200
 
 @app.route('/planets', methods=['GET'])
+@coalesced
 def get_all_planets():
-    all_planets = Planet.query.all()  
+    if 'ids' in request.args:
+        return get_many(Planet, request.args['ids'], 'Planet not found')
+
+    all_planets = Planet.query_live().all()  
     all_planets_serialize = [planet.serialize() for planet in all_planets]  
     
     return jsonify(all_planets_serialize), 200
 
 
 @app.route('/planets/<int:planet_id>', methods=['GET'])
+@coalesced
 def get_planet(planet_id):
-    planet = Planet.query.get(planet_id)  
+    planet = Planet.get_live(planet_id)  
     if planet is None:
         return jsonify({'msg': 'Planet not found'}), 404  
 
     return jsonify(planet.serialize()), 200  
 
 @app.route('/planets', methods=['POST'])
+@idempotent
 def create_planet():
     body = request.get_json()  
     if not body:
@@ -223,12 +273,13 @@ def create_planet():
     
     db.session.add(new_planet)
     db.session.commit()
+    broker.publish('planet', 'created', new_planet.serialize())
 
     return jsonify(new_planet.serialize()), 201 
 
 @app.route('/planets/<int:planet_id>', methods=['PUT'])
 def update_planet(planet_id):
-    planet = Planet.query.get(planet_id)  
+    planet = Planet.get_live(planet_id)  
     if planet is None:
         return jsonify({'msg': 'Planet not found'}), 404
 
@@ -247,17 +298,20 @@ def update_planet(planet_id):
         planet.population = body["population"]
 
     db.session.commit()  
+    broker.publish('planet', 'updated', planet.serialize())
 
     return jsonify(planet.serialize()), 200
 
 @app.route('/planets/<int:planet_id>', methods=['DELETE'])
 def delete_planet(planet_id):
-    planet = Planet.query.get(planet_id)  
+    planet = Planet.get_live(planet_id)  
     if planet is None:
         return jsonify({'msg': 'Planet not found'}), 404
 
-    db.session.delete(planet)  
+    planet.deleted_at = db.func.now()
     db.session.commit()
+    purger.enqueue(Planet, planet_id)
+    broker.publish('planet', 'deleted', {"id": planet_id})
 
     return jsonify({"msg": "Planet deleted successfully"}), 200
 
@@ -270,13 +324,14 @@ def get_user_favorites():
         return jsonify({"msg": "User not found"}), 404
 
     favorites = {
-        "planets": [favorite_planet.serialize() for favorite_planet in user.favorite_planets],
-        "people": [favorite_person.serialize() for favorite_person in user.favorite_people]
+        "planets": [favorite_planet.serialize() for favorite_planet in user.favorite_planets if favorite_planet.planet.deleted_at is None],
+        "people": [favorite_person.serialize() for favorite_person in user.favorite_people if favorite_person.people.deleted_at is None]
     }
 
     return jsonify(favorites), 200
 
 @app.route('/favorite/planet/<int:planet_id>', methods=['POST'])
+@idempotent
 def add_favorite_planet(planet_id):
     user_id = 1  # Suponiendo que el usuario actual tiene ID 1
     user = User.query.get(user_id)
@@ -284,7 +339,7 @@ def add_favorite_planet(planet_id):
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
-    planet = Planet.query.get(planet_id)
+    planet = Planet.get_live(planet_id)
     if not planet:
         return jsonify({"msg": "Planet not found"}), 404
 
@@ -295,10 +350,12 @@ def add_favorite_planet(planet_id):
     favorite_planet = FavoritePlanet(user_id=user_id, planet_id=planet_id)
     db.session.add(favorite_planet)
     db.session.commit()
+    broker.publish('favorite', 'created', {"user_id": user_id, "planet_id": planet_id})
 
     return jsonify({"msg": "Planet added to favorites"}), 201
 
 @app.route('/favorite/people/<int:people_id>', methods=['POST'])
+@idempotent
 def add_favorite_people(people_id):
     user_id = 1  # Assuming the current user has ID 1
     user = User.query.get(user_id)
@@ -306,7 +363,7 @@ def add_favorite_people(people_id):
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
-    person = People.query.get(people_id)
+    person = People.get_live(people_id)
     if not person:
         return jsonify({"msg": "Person not found"}), 404
 
@@ -317,6 +374,7 @@ def add_favorite_people(people_id):
     favorite_person = FavoritePeople(user_id=user_id, people_id=people_id)
     db.session.add(favorite_person)
     db.session.commit()
+    broker.publish('favorite', 'created', {"user_id": user_id, "people_id": people_id})
 
     return jsonify({"msg": "Person added to favorites"}), 201
 
@@ -335,6 +393,7 @@ def remove_favorite_planet(planet_id):
 
     db.session.delete(favorite_planet)
     db.session.commit()
+    broker.publish('favorite', 'deleted', {"user_id": user_id, "planet_id": planet_id})
 
     return jsonify({"msg": "Favorite planet removed successfully"}), 200
 
@@ -353,9 +412,42 @@ def remove_favorite_people(people_id):
 
     db.session.delete(favorite_person)
     db.session.commit()
+    broker.publish('favorite', 'deleted', {"user_id": user_id, "people_id": people_id})
 
     return jsonify({"msg": "Favorite person removed successfully"}), 200
- 
+
+@app.route('/metrics/coalescing', methods=['GET'])
+def get_coalescing_metrics():
+    return jsonify(single_flight.metrics()), 200
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    topics = request.args.get('topics')
+    subscription = broker.subscribe(topics.split(',') if topics else None)
+    if subscription is None:
+        return jsonify({"msg": "Too many event streams, try again later"}), 503, {"Retry-After": "5"}
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = subscription.get(timeout=15)
+                if event is None:
+                    # Keep proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(generate(), mimetype='text/event-stream', headers=headers)
+
+@app.cli.command('purge-favorites')
+def purge_favorites_command():
+    purged = purge_deleted_favorites()
+    click.echo(f'Purged {purged} favorites of deleted people and planets')
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
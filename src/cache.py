@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+from coalescing import single_flight
+from events import PostgresBackend, broker
+
+
+class EntityCache:
+    # Serialized people and planets by id, so ?ids= batch reads can skip the DB
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get_many(self, kind, ids):
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for entity_id in ids:
+                entry = self.entries.get((kind, entity_id))
+                if entry is not None and entry[1] > now:
+                    found[entity_id] = entry[0]
+        return found
+
+    def set_many(self, kind, serialized, generation):
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            # Skip results read before a write invalidated them
+            if generation != self.generation:
+                return
+            for entity_id, value in serialized.items():
+                self.entries.pop((kind, entity_id), None)
+                self.entries[(kind, entity_id)] = (value, expires_at)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, kind, entity_id=None):
+        with self.lock:
+            self.generation += 1
+            if entity_id is not None:
+                self.entries.pop((kind, entity_id), None)
+            else:
+                for key in [key for key in self.entries if key[0] == kind]:
+                    del self.entries[key]
+
+
+# Other workers only hear about writes through the Postgres backend, without it
+# entries must not outlive the coalesced GETs' fresh window
+entity_cache = EntityCache(ttl=60 if isinstance(broker.backend, PostgresBackend) else single_flight.fresh_ttl)
+
+
+def load_entities(model, ids):
+    kind = model.__tablename__
+    generation = entity_cache.generation
+    found = entity_cache.get_many(kind, ids)
+    missing = [entity_id for entity_id in set(ids) if entity_id not in found]
+    if missing:
+        # One IN query for everything the cache didn't have
+        rows = model.query_live().filter(model.id.in_(missing)).all()
+        serialized = {row.id: row.serialize() for row in rows}
+        entity_cache.set_many(kind, serialized, generation)
+        found.update(serialized)
+    return found
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, request
+
+SHARED_HEADERS = ('Content-Type',)
+
+
+class Call:
+    def __init__(self, generation):
+        self.generation = generation
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class SingleFlight:
+    def __init__(self, fresh_ttl=1, stale_ttl=5, max_entries=1000):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.calls = {}
+        self.results = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "executions": 0, "coalesced": 0, "fresh_hits": 0, "stale_hits": 0}
+
+    def do(self, key, fn):
+        now = time.monotonic()
+        with self.lock:
+            self.stats["requests"] += 1
+            cached = self.results.get(key)
+            age = now - cached[1] if cached is not None else None
+            if age is not None and age < self.fresh_ttl:
+                self.stats["fresh_hits"] += 1
+                return cached[0]
+            call = self.calls.get(key)
+            leader = call is None
+            if not leader:
+                # Someone is already revalidating, serve the stale copy while it's recent enough
+                if age is not None and age < self.fresh_ttl + self.stale_ttl:
+                    self.stats["stale_hits"] += 1
+                    return cached[0]
+                self.stats["coalesced"] += 1
+            else:
+                call = Call(self.generation)
+                self.calls[key] = call
+                self.stats["executions"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+                # Don't keep results computed before a write invalidated them
+                if call.error is None and call.generation == self.generation:
+                    self.results.pop(key, None)
+                    self.results[key] = (call.value, time.monotonic())
+                    while len(self.results) > self.max_entries:
+                        self.results.popitem(last=False)
+            call.done.set()
+        return call.value
+
+    def invalidate(self, prefix=''):
+        with self.lock:
+            self.generation += 1
+            for key in [key for key in self.results if key.startswith(prefix)]:
+                del self.results[key]
+
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        requests = stats["requests"]
+        # Coalescing only counts requests that waited on an in-flight query,
+        # answers from the fresh/stale window are reported as cache hits
+        stats["coalescing_ratio"] = stats["coalesced"] / requests if requests else 0
+        stats["cache_hit_ratio"] = (stats["fresh_hits"] + stats["stale_hits"]) / requests if requests else 0
+        return stats
+
+
+single_flight = SingleFlight()
+
+
+def coalesced(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        def load():
+            response = current_app.make_response(view(*args, **kwargs))
+            headers = [(name, response.headers[name]) for name in SHARED_HEADERS if name in response.headers]
+            return response.get_data(), response.status_code, headers
+
+        body, status, headers = single_flight.do(request.full_path, load)
+        return Response(body, status, headers)
+
+    return wrapper
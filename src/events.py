@@ -0,0 +1,173 @@
+import json
+import os
+import select
+import threading
+import time
+import uuid
+from collections import deque
+
+EVENTS_CHANNEL = 'catalog_events'
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7900
+
+
+class Subscription:
+    def __init__(self, topics=None, max_buffer=100):
+        self.topics = set(topics) if topics else None
+        self.max_buffer = max_buffer
+        self.buffer = deque()
+        self.dropped = 0
+        self.condition = threading.Condition()
+
+    def wants(self, event):
+        return self.topics is None or event['topic'] in self.topics
+
+    def push(self, event):
+        with self.condition:
+            # A slow consumer loses its oldest events instead of growing without bound
+            if len(self.buffer) >= self.max_buffer:
+                self.buffer.popleft()
+                self.dropped += 1
+            self.buffer.append(event)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.buffer and not self.dropped:
+                self.condition.wait(timeout)
+            if self.dropped:
+                # Tell the client it missed events so it can refetch what it shows
+                dropped, self.dropped = self.dropped, 0
+                return {"topic": "stream", "action": "resync", "data": {"dropped": dropped}}
+            if self.buffer:
+                return self.buffer.popleft()
+            return None
+
+
+class LocalBackend:
+    # In-process stand-in: events only reach subscribers of this worker
+    def start(self, dispatch):
+        self.dispatch = dispatch
+
+    def send(self, event):
+        self.dispatch(event)
+
+
+class PostgresBackend:
+    # Fans events out to every worker through LISTEN/NOTIFY
+    def __init__(self, dsn, channel=EVENTS_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def _connect(self):
+        import psycopg2
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def start(self, dispatch):
+        self.dispatch = dispatch
+        thread = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+        thread.start()
+
+    def send(self, event):
+        payload = json.dumps(event)
+        if len(payload) > MAX_NOTIFY_PAYLOAD:
+            # Too big for NOTIFY, clients can refetch the entity by id
+            payload = json.dumps(dict(event, data={"id": event['data'].get('id')}))
+        with self.lock:
+            try:
+                if self.connection is None or self.connection.closed:
+                    self.connection = self._connect()
+                with self.connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, payload))
+            except Exception:
+                self.connection = None
+                raise
+
+    def _listen(self):
+        while True:
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                while True:
+                    if select.select([connection], [], [], 30) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        self.dispatch(json.loads(notify.payload))
+            except Exception:
+                # Lost the connection, wait a bit and listen again
+                time.sleep(1)
+
+
+class EventBroker:
+    def __init__(self, backend=None, max_buffer=100, max_subscriptions=800):
+        self.max_buffer = max_buffer
+        self.max_subscriptions = max_subscriptions
+        self.subscriptions = set()
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.origin = uuid.uuid4().hex
+        self.backend = backend or LocalBackend()
+        self.backend.start(self.dispatch)
+
+    def subscribe(self, topics=None):
+        with self.lock:
+            if len(self.subscriptions) >= self.max_subscriptions:
+                return None
+            subscription = Subscription(topics, self.max_buffer)
+            self.subscriptions.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def publish(self, topic, action, data):
+        event = {"topic": topic, "action": action, "data": data, "at": time.time(), "origin": self.origin}
+        # Local listeners run right away so this worker never serves data older than its own writes
+        self._notify_listeners(event)
+        try:
+            self.backend.send(event)
+        except Exception:
+            # Notifications are best effort, the write itself already succeeded
+            pass
+
+    def _notify_listeners(self, event):
+        for listener in self.listeners:
+            listener(event)
+
+    def dispatch(self, event):
+        if event.get('origin') != self.origin:
+            self._notify_listeners(event)
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.push(event)
+
+
+def create_broker(db_url=None):
+    backend = None
+    if os.getenv('EVENTS_BACKEND') == 'postgres' and db_url is not None:
+        backend = PostgresBackend(db_url)
+    # Streams are greenlets under the gevent worker, the limit is a memory budget:
+    # a full 100 event buffer is around 50KB, so 800 streams stay under 40MB and
+    # leave room for regular requests within --worker-connections 1000
+    max_streams = int(os.getenv('EVENTS_MAX_STREAMS', 800))
+    return EventBroker(backend, max_subscriptions=max_streams)
+
+
+def format_sse(event):
+    return f"event: {event['topic']}.{event['action']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+broker = create_broker(os.getenv('DATABASE_URL'))
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, jsonify, request
+
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+
+
+class IdempotencyEntry:
+    def __init__(self, fingerprint, expires_at):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.response = None
+        self.done = threading.Event()
+
+
+class IdempotencyStore:
+    def __init__(self, max_entries=10000, ttl=24 * 60 * 60, wait_timeout=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _purge(self, now):
+        # Entries are kept in creation order, so the expired ones are at the front
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if entry.expires_at > now and len(self.entries) <= self.max_entries:
+                break
+            del self.entries[key]
+
+    def claim(self, key, fingerprint):
+        # Returns the entry for the key and whether the caller has to run the request
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                return entry, False
+            entry = IdempotencyEntry(fingerprint, now + self.ttl)
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            self._purge(now)
+            return entry, True
+
+    def complete(self, entry, response):
+        headers = [(name, response.headers[name]) for name in REPLAYED_HEADERS if name in response.headers]
+        entry.response = (response.get_data(), response.status_code, headers)
+        entry.done.set()
+
+    def release(self, key, entry):
+        # Forget a failed attempt so the next retry runs the request again
+        with self.lock:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+        entry.done.set()
+
+
+idempotency_store = IdempotencyStore()
+
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > 255:
+            return jsonify({"msg": "Idempotency-Key must be between 1 and 255 characters"}), 400
+
+        scope = f'{request.method} {request.path} {key}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        while True:
+            entry, owner = idempotency_store.claim(scope, fingerprint)
+            if entry.fingerprint != fingerprint:
+                return jsonify({"msg": "Idempotency-Key was already used with a different body"}), 422
+            if owner:
+                break
+            # Same request already in flight, wait for its response instead of writing twice
+            if not entry.done.wait(idempotency_store.wait_timeout):
+                return jsonify({"msg": "A request with this Idempotency-Key is still in progress"}), 409
+            if entry.response is not None:
+                body, status, headers = entry.response
+                response = Response(body, status, headers)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(scope, entry)
+            raise
+        if response.status_code >= 500:
+            idempotency_store.release(scope, entry)
+        else:
+            idempotency_store.complete(entry, response)
+        return response
+
+    return wrapper
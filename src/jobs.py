@@ -0,0 +1,70 @@
+import queue
+import threading
+from models import db, People, Planet, FavoritePeople, FavoritePlanet
+
+PURGE_BATCH_SIZE = 500
+
+# Favorite rows that point at each soft deletable model
+FAVORITES_OF = {
+    People: FavoritePeople.people_id,
+    Planet: FavoritePlanet.planet_id,
+}
+
+
+def purge_favorites(model, entity_id, batch_size=PURGE_BATCH_SIZE):
+    column = FAVORITES_OF[model]
+    favorite_model = column.class_
+    purged = 0
+    # Small batches keep each transaction and its locks short
+    while True:
+        ids = [row.id for row in db.session.query(favorite_model.id).filter(column == entity_id).limit(batch_size)]
+        if not ids:
+            return purged
+        favorite_model.query.filter(favorite_model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        purged += len(ids)
+
+
+def purge_deleted_favorites(batch_size=PURGE_BATCH_SIZE):
+    # Catches up on purges lost when a worker stopped before finishing its queue
+    purged = 0
+    for model, column in FAVORITES_OF.items():
+        deleted_ids = db.session.query(model.id).filter(model.deleted_at.isnot(None), model.id.in_(db.session.query(column)))
+        for (entity_id,) in deleted_ids.all():
+            purged += purge_favorites(model, entity_id, batch_size)
+    return purged
+
+
+class FavoritePurger:
+    def __init__(self, app, batch_size=PURGE_BATCH_SIZE):
+        self.app = app
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def enqueue(self, model, entity_id):
+        with self.lock:
+            # Started lazily so every gunicorn worker gets its own thread after forking
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='favorite-purger', daemon=True)
+                self.thread.start()
+        self.queue.put((model, entity_id))
+
+    def _run(self):
+        # Queued purges die with the worker, so pick up whatever a previous one left behind
+        with self.app.app_context():
+            try:
+                purge_deleted_favorites(self.batch_size)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Could not purge favorites of deleted people and planets')
+        while True:
+            model, entity_id = self.queue.get()
+            with self.app.app_context():
+                try:
+                    purge_favorites(model, entity_id, self.batch_size)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Could not purge favorites of %s %s', model.__name__, entity_id)
+            self.queue.task_done()
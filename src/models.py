@@ -2,7 +2,26 @@ from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
 
+class SoftDeleteMixin:
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    @classmethod
+    def query_live(cls):
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    @classmethod
+    def get_live(cls, entity_id):
+        entity = cls.query.get(entity_id)
+        if entity is None or entity.deleted_at is not None:
+            return None
+        return entity
+
 class User(db.Model):
+    # Pattern ops so the admin's email prefix search can use an index
+    __table_args__ = (
+        db.Index('ix_user_email', 'email', postgresql_ops={'email': 'varchar_pattern_ops'}),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(80), unique=False, nullable=False)
@@ -19,7 +38,15 @@ class User(db.Model):
             # do not serialize the password, its a security breach
         }
 
-class People(db.Model):
+class People(SoftDeleteMixin, db.Model):
+    # Partial index so live lookups and listings skip deleted rows cheaply,
+    # pattern ops on name for the admin's prefix search and a plain one for sorting
+    __table_args__ = (
+        db.Index('ix_people_live', 'id', postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_people_name', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}),
+        db.Index('ix_people_name_order', 'name'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     birth_year = db.Column(db.String(10), nullable=True)
@@ -41,7 +68,13 @@ class People(db.Model):
             
         }
 
-class Planet(db.Model):
+class Planet(SoftDeleteMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_planet_live', 'id', postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_planet_name', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}),
+        db.Index('ix_planet_name_order', 'name'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     climate = db.Column(db.String(50), nullable=True)
@@ -62,8 +95,8 @@ class Planet(db.Model):
 
 class FavoritePeople(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    people_id = db.Column(db.Integer, db.ForeignKey('people.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    people_id = db.Column(db.Integer, db.ForeignKey('people.id'), nullable=False, index=True)
 
     user = db.relationship('User', backref=db.backref('favorite_people', lazy=True))
     people = db.relationship('People')
@@ -82,8 +115,8 @@ class FavoritePeople(db.Model):
 
 class FavoritePlanet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'), nullable=False, index=True)
 
     user = db.relationship('User', backref=db.backref('favorite_planets', lazy=True))
     planet = db.relationship('Planet')
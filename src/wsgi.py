@@ -1,6 +1,14 @@
 # This file was created to run the application on heroku using gunicorn.
 # Read more about it here: https://devcenter.heroku.com/articles/python-gunicorn
 
+from gevent import monkey
+
+# gunicorn's gevent worker patches the stdlib, psycopg2 has to be told to yield
+# to other greenlets while it waits on Postgres or one query blocks every stream
+if monkey.is_module_patched('socket'):
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
 from app import app as application
 
 if __name__ == "__main__":